@@ -1,65 +1,258 @@
 import time
+import array
 import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
 import rtmidi
 from mido import MidiFile, MidiTrack, Message, MetaMessage
 import os
+import re
 import queue
+import struct
 from datetime import datetime
+from itertools import repeat
+from operator import floordiv, sub
+
+# 默认保存路径（桌面），启动时计算一次
+_DESKTOP = os.path.join(os.path.expanduser("~"), "Desktop")
+
+# 事件缓冲区的预分配容量（通道消息最多3字节，写满后按同样大小扩容）
+EVENT_BUFFER_SIZE = 200000
+
+# 录制文件的分辨率（与mido默认值一致）
+SMF_TICKS_PER_BEAT = 480
+# 按状态字节索引的通道消息长度，0表示不写入MIDI文件的状态（sysex单独处理）
+_CHANNEL_MSG_LENGTHS = bytes(0x80) + bytes([3] * 0x40 + [2] * 0x20 + [3] * 0x10) + bytes(0x10)
+
+def _encode_vlq(value):
+    """编码MIDI可变长度整数"""
+    buf = bytearray((value & 0x7F,))
+    value >>= 7
+    while value:
+        buf.append(0x80 | (value & 0x7F))
+        value >>= 7
+    buf.reverse()
+    return buf
+
+# 日志行：时间戳/标记、事件类型、其余参数（跳过#注释行和不足两列的行）
+_LOG_LINE_RE = re.compile(r'^[^\S\n]*([^\s#]\S*)[^\S\n]+(\S+)(.*)$', re.M)
+# 日志参数：形如 ch=1 n=60 的键值对
+_LOG_PARAM_RE = re.compile(r'(?<!\S)([^\s=]*)=(\S*)')
+# 支持的日志事件类型与需要跳过的文件头标记
+_LOG_SUPPORTED_EVENTS = frozenset({'timesig', 'tempo', 'on', 'off', 'par', 'prch', 'pb'})
+_LOG_SKIP_HEADS = frozenset({'MFile', 'MTrk', 'TrkEnd'})
+# 日志事件对应的mido消息参数名
+_LOG_MSG_FIELDS = {
+    'control_change': ('control', 'value'),
+    'program_change': ('program',),
+    'pitchwheel': ('pitch',),
+    'note_on': ('note', 'velocity'),
+    'note_off': ('note', 'velocity'),
+}
+
+def _log_msg_template(msg_type, channel, a, b):
+    """构造并校验一条日志消息，返回不含time的消息参数"""
+    fields = _LOG_MSG_FIELDS[msg_type]
+    msg = Message(msg_type, channel=channel, **dict(zip(fields, (a, b))))
+    template = vars(msg).copy()
+    del template['time']
+    return template
+
+def _log_row_template(event_type, rest, cache):
+    """解析一行日志的参数文本，返回不含time的消息参数；不生成消息的行返回None"""
+    # 统一参数解析
+    params = {key: int(val) for key, val in _LOG_PARAM_RE.findall(rest)}
+
+    channel = params.get('ch', 1) - 1  # 通道号转换
+
+    # 处理不同事件类型：先归一为(类型, 通道, 参数1, 参数2)
+    if event_type == 'par' and 'c' in params:
+        key = ('control_change', channel, params['c'], params['v'])
+    elif event_type == 'prch' and 'p' in params:
+        key = ('program_change', channel, params['p'], None)
+    elif event_type == 'pb' and 'v' in params:
+        # 转换14位Pitch Bend值（假设v是0-16383），转换为-8192到8191
+        key = ('pitchwheel', channel, min(max(params['v'], 0), 16383) - 8192, None)
+    elif event_type == 'on' and 'n' in params:
+        key = ('note_on', channel, params['n'], params.get('v', 64))
+    elif event_type == 'off' and 'n' in params:
+        key = ('note_off', channel, params['n'], params.get('v', 64))
+    else:
+        return None
+
+    # 相同参数的消息只校验一次
+    template = cache.get(key)
+    if template is None:
+        template = cache[key] = _log_msg_template(*key)
+    return template
+
+class SPSCRing:
+    """单生产者单消费者环形队列：预分配槽位，读写各自只改动自己的索引，无需加锁"""
+    def __init__(self, capacity=1024):
+        self._capacity = capacity
+        self._tags = [None] * capacity
+        self._msgs = [None] * capacity
+        self._head = 0  # 仅消费者修改
+        self._tail = 0  # 仅生产者修改
+
+    def push(self, tag, msg):
+        """写入一条消息，队列已满时丢弃并返回False"""
+        tail = self._tail
+        nxt = tail + 1
+        if nxt == self._capacity:
+            nxt = 0
+        if nxt == self._head:
+            return False
+        self._tags[tail] = tag
+        self._msgs[tail] = msg
+        self._tail = nxt  # 先写槽位再发布索引
+        return True
+
+    def pop(self):
+        """取出一条消息，队列为空时返回None"""
+        head = self._head
+        if head == self._tail:
+            return None
+        item = (self._tags[head], self._msgs[head])
+        self._msgs[head] = None
+        nxt = head + 1
+        self._head = 0 if nxt == self._capacity else nxt
+        return item
 
 class MidiCoreThread(threading.Thread):
     """优化后的核心线程：专注事件收集与转发"""
-    def __init__(self):
+    def __init__(self, notify=None):
         super().__init__()
         self.input = rtmidi.MidiIn()
         self.output = rtmidi.MidiOut()
         self.recording = False
         self.virtual_output = False
-        self._event_queue = queue.Queue()
+        self._event_queue = SPSCRing()  # 发往GUI的状态消息
+        self._notify = notify  # 有新消息时唤醒GUI的回调
+        self._notify_pending = False  # 已唤醒GUI但GUI尚未开始取消息
+        self._dropped = 0  # GUI无法处理时丢弃的消息数
         self._control_queue = queue.Queue()
-        self.input.set_callback(self._midi_callback)
         self.bpm = 120  # 新增BPM属性
-        # 移除锁机制
-        self.events = []
+        # 预分配的SoA事件缓冲区：回调中按索引写入，避免逐事件分配对象
+        self._ts_buf = array.array('q', [0]) * EVENT_BUFFER_SIZE  # 单调时钟，纳秒
+        self._status = bytearray(EVENT_BUFFER_SIZE)
+        self._d1 = bytearray(EVENT_BUFFER_SIZE)
+        self._d2 = bytearray(EVENT_BUFFER_SIZE)
+        self._size = bytearray(EVENT_BUFFER_SIZE)  # 消息长度，0表示超长消息（sysex）
+        self._sysex = {}  # 超过3字节的消息按索引另存
+        self._write_idx = 0
+        self._midi_callback = self._make_midi_callback()
+        self.input.set_callback(self._midi_callback)  # 缓冲区就绪后再注册回调
         # 修改默认保存路径为桌面
-        self.save_path = os.path.join(os.path.expanduser("~"), "Desktop")
+        self.save_path = _DESKTOP
         self.filename = "recording.mid"
+        self._full_path = os.path.join(self.save_path, self.filename)
         self._active = True  # 新增线程活动状态标识
-
-    def _midi_callback(self, event, _):
-        message, timestamp = event
-        if self.recording:
-            # 直接操作列表（单线程无需锁）
-            self.events.append({
-                'data': bytes(message),
-                'timestamp': time.time()
-            })
-        if self.virtual_output:
-            return
-        self.output.send_message(message)
+        self._ports = None  # 当前已连接的(输入, 输出)端口
+
+    def _make_midi_callback(self):
+        """生成MIDI输入回调：缓冲区与方法作为闭包变量，回调中几乎不做属性查找"""
+        clock = time.perf_counter_ns
+        send_message = self.output.send_message
+        ts_buf = self._ts_buf
+        status = self._status
+        d1 = self._d1
+        d2 = self._d2
+        sizes = self._size
+        sysex = self._sysex
+
+        def midi_callback(event, _):
+            """rtmidi线程中持有GIL执行：先取时间戳并转发，再写缓冲区"""
+            message = event[0]
+            now = clock()
+            if not self.virtual_output:
+                send_message(message)
+            if self.recording:
+                # 直接写入预分配缓冲区（单线程无需锁，扩容为原地扩展，闭包引用始终有效）
+                idx = self._write_idx
+                if idx == len(status):
+                    self._grow_buffers()
+                size = len(message)
+                status[idx] = message[0]
+                if size <= 3:
+                    d1[idx] = message[1] if size > 1 else 0
+                    d2[idx] = message[2] if size > 2 else 0
+                    sizes[idx] = size
+                else:
+                    sysex[idx] = bytes(message)
+                    sizes[idx] = 0
+                ts_buf[idx] = now
+                self._write_idx = idx + 1
+
+        return midi_callback
+
+    def _grow_buffers(self):
+        """缓冲区写满时原地扩容"""
+        self._ts_buf.extend(array.array('q', [0]) * EVENT_BUFFER_SIZE)
+        for buf in (self._status, self._d1, self._d2, self._size):
+            buf.extend(bytes(EVENT_BUFFER_SIZE))
+
+    def _event_data(self, i):
+        """从缓冲区还原第i个事件的原始字节"""
+        size = self._size[i]
+        if not size:
+            return self._sysex[i]
+        return bytes((self._status[i], self._d1[i], self._d2[i])[:size])
 
     def run(self):
         """简化的主循环"""
         while self._active:
-            self._process_control()
-            time.sleep(0.001)
+            # 阻塞等待控制命令，MIDI事件由rtmidi回调线程处理
+            try:
+                cmd, *args = self._control_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._dispatch(cmd, args)
+            except Exception as e:
+                # 线程常驻，单个命令出错不能导致线程退出
+                self._post('ERROR', f'{cmd}执行失败：{str(e)}')
         self._close_ports()
 
-    def _process_control(self):
-        try:
-            cmd, *args = self._control_queue.get_nowait()
-            if cmd == 'CONNECT':
-                self._connect_device(*args)
-            elif cmd == 'START_RECORD':
-                self._start_recording(*args)
-            elif cmd == 'STOP_RECORD':
+    def _dispatch(self, cmd, args):
+        if cmd == 'CONNECT':
+            self._connect_device(*args)
+        elif cmd == 'START_RECORD':
+            self._start_recording(*args)
+        elif cmd == 'STOP_RECORD':
+            self._stop_recording()
+        elif cmd == 'SHUTDOWN':
+            if self.recording:
                 self._stop_recording()
-                self._active = False  # 先保存再停止线程
-        except queue.Empty:
-            pass
+            self._active = False  # 先保存再停止线程
+
+    def _post(self, tag, msg):
+        """向GUI发送状态消息并唤醒GUI处理"""
+        ring = self._event_queue
+        if self._dropped and ring.push('ERROR', f'消息队列已满，{self._dropped}条消息被丢弃'):
+            self._dropped = 0
+        if not ring.push(tag, msg):
+            # 队列已满：等待GUI取走消息，GUI已关闭或长时间无响应时丢弃并计数
+            self._wake()
+            deadline = time.monotonic() + 1.0
+            while self._notify is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+                if ring.push(tag, msg):
+                    break
+            else:
+                self._dropped += 1
+        self._wake()
+
+    def _wake(self):
+        """唤醒GUI；上一次唤醒尚未处理时不重复唤醒，一次处理会取空整个队列"""
+        notify = self._notify
+        if notify is not None and not self._notify_pending:
+            self._notify_pending = True
+            notify()
 
     def _connect_device(self, in_port, out_port):
+        if self._ports == (in_port, out_port):
+            return  # 线程常驻，端口未变化时无需重新打开
         try:
             self._close_ports()
             if in_port < self.input.get_port_count():
@@ -67,87 +260,112 @@ class MidiCoreThread(threading.Thread):
             self.virtual_output = (out_port == -1)
             if not self.virtual_output and out_port < self.output.get_port_count():
                 self.output.open_port(out_port)
-            self._event_queue.put(('STATUS', '设备已连接'))
+            self._ports = (in_port, out_port)
+            self._post('STATUS', '设备已连接')
         except rtmidi.RtMidiError as e:
-            self._event_queue.put(('ERROR', str(e)))
+            self._post('ERROR', str(e))
 
     def _start_recording(self, save_path, filename, bpm):
-        self.events.clear()
+        self._write_idx = 0
+        self._sysex.clear()
         self.save_path = save_path
         self.filename = filename
-        self.bpm = bpm  # 设置BPM
+        self._full_path = os.path.join(save_path, filename)  # 开始时算好，停止保存时直接使用
+        self.bpm = min(max(int(bpm), 20), 300)  # 设置BPM，限制在界面允许的范围内
         self.recording = True
 
     def _stop_recording(self):
-        """停止录制时立即保存并终止线程"""
+        """停止录制时立即保存，线程与端口保持打开供下次录制"""
         self.recording = False
-        self._save_midi()
+        try:
+            self._save_midi()
+        finally:
+            self._write_idx = 0
+            self._sysex.clear()
+            self._post('STOPPED', None)  # 录制状态只由核心线程通知GUI清除
 
     def _save_midi(self):
-        if not self.events:
+        """直接由缓冲区生成标准MIDI文件字节，不经过mido逐条构造消息"""
+        count = self._write_idx
+        if not count:
            return
 
-        mid = MidiFile()
-        track = MidiTrack()
-        mid.tracks.append(track)
-
         # 添加BPM元事件（放在第一个位置）
         microseconds_per_beat = int(60000000 / self.bpm)
-        track.append(MetaMessage('set_tempo', tempo=microseconds_per_beat, time=0))
-
-        # 查找第一个note_on事件作为基准时间
-        base_time = None
-        first_note_index = 0
-        for i, event in enumerate(self.events):
-            try:
-                msg = Message.from_bytes(event['data'])
-                if msg.type == 'note_on':
-                    base_time = event['timestamp']
-                    first_note_index = i
-                    break
-            except:
+        track = bytearray(b'\x00\xff\x51\x03')
+        track += microseconds_per_beat.to_bytes(3, 'big')
+
+        ts = self._ts_buf
+        status = self._status
+        sizes = self._size
+
+        # 单调时钟无需时间校正：先换算为毫秒再求差，整数运算且不累积截断误差
+        ms = list(map(floordiv, ts[:count], repeat(1000000)))
+        deltas = [0]
+        deltas += map(sub, ms[1:], ms[:-1])
+
+        d1 = self._d1
+        d2 = self._d2
+        lengths = _CHANNEL_MSG_LENGTHS
+        running = None  # 当前运行状态字节
+        carry = 0  # 跳过的事件的时间差累加到下一个写入的事件
+        invalid = []  # 无效消息的索引，保存结束后统一上报
+        for i, delta in zip(range(count), deltas):
+            delta += carry
+            st = status[i]
+            size = sizes[i]
+            if st == 0xF0:
+                data = self._event_data(i)
+                if data[-1] != 0xF7 or max(data[1:-1], default=0) > 0x7F:
+                    invalid.append(i)
+                    carry = delta
+                    continue
+                track += _encode_vlq(delta)
+                track.append(0xF0)
+                track += _encode_vlq(len(data) - 1)
+                track += data[1:]
+                running = None
+            elif size == lengths[st]:
+                if d1[i] | d2[i] > 0x7F:
+                    invalid.append(i)
+                    carry = delta
+                    continue
+                if delta < 0x80:
+                    track.append(delta)
+                else:
+                    track += _encode_vlq(delta)
+                if st != running:
+                    track.append(st)
+                    running = st
+                track.append(d1[i])
+                if size == 3:
+                    track.append(d2[i])
+            else:
+                # 系统公共/实时消息不属于MIDI文件事件
+                carry = delta
                 continue
+            carry = 0
+        track += b'\x00\xff\x2f\x00'  # end_of_track
 
-        # 如果没有note_on事件，使用第一个事件作为基准
-        if base_time is None:
-            base_time = self.events[0]['timestamp']
-            first_note_index = 0
-
-        prev_time = base_time
+        if invalid:
+            first = self._event_data(invalid[0]).hex(' ')
+            if len(invalid) == 1:
+                self._post('ERROR', f"无效消息：{first}")
+            else:
+                self._post('ERROR', f"已跳过{len(invalid)}条无效消息，首条：{first}")
 
-        # 处理所有事件（包含第一个note_on之前的其他事件）
-        for event in self.events:
-            current_time = event['timestamp']
-            delta = int((current_time - prev_time) * 1000)  # 转换为毫秒
-        
-            try:
-                msg = Message.from_bytes(event['data'])
-            
-                # 时间校正逻辑
-                if delta < 0:
-                    if msg.type == 'note_off':
-                        continue  # 直接跳过note_off事件
-                    else:
-                        delta = 0  # 其他类型设置为0
-            
-                # 特殊处理note_on的0时间（可选）
-                if delta == 0 and msg.type == 'note_on':
-                    track.append(msg.copy(time=0))
-                else:
-                    track.append(msg.copy(time=delta))
-                
-                prev_time = current_time  # 仅更新有效事件的时间戳
-            except Exception as e:
-                self._event_queue.put(('ERROR', f"无效消息：{str(e)}"))
-
-        full_path = os.path.join(self.save_path, self.filename)
+        full_path = self._full_path
         try:
-            mid.save(full_path)
-            self._event_queue.put(('STATUS', f'文件已保存：{full_path}'))
+            with open(full_path, 'wb') as f:
+                f.write(struct.pack('>4sLhhh', b'MThd', 6, 1, 1, SMF_TICKS_PER_BEAT))
+                f.write(struct.pack('>4sL', b'MTrk', len(track)))
+                f.write(track)
+            self._post('STATUS', f'文件已保存：{full_path}')
         except Exception as e:
-            self._event_queue.put(('ERROR', f'保存失败：{str(e)}'))
+            self._post('ERROR', f'保存失败：{str(e)}')
 
     def _close_ports(self):
+        self._ports = None
         if self.input.is_port_open():
             self.input.close_port()
         if self.output.is_port_open():
@@ -161,42 +379,68 @@ class MidiCoreThread(threading.Thread):
         tempo = 500000  # 默认tempo (120 BPM)
         time_sig = (4, 4, 24, 8)  # 默认拍号
 
-        # 预扫描日志获取元数据
-        for line in log_content.split('\n'):
-            line = line.strip()
-            if not line or line.startswith('#'):  # 跳过注释
-                continue
-            
-            parts = line.split()
-            if len(parts) < 2:  # 基本长度校验
-                continue
-            
-            # 仅处理元数据行 ---------------------------------------------------
-            if parts[0] == 'MFile':
-                if len(parts) >= 4:
+        events = []
+        cache = {}  # (类型, 通道, 参数1, 参数2) -> 已校验的消息参数
+        rows = {}  # (事件类型, 参数文本) -> 消息参数，不生成消息的行为空dict
+        prev_ticks = 0
+        # 单次扫描：元数据与事件在同一遍中提取
+        for m in _LOG_LINE_RE.finditer(log_content):
+            head, kind, rest = m.groups()
+
+            # 元数据行 ---------------------------------------------------------
+            if head == 'MFile':
+                parts = rest.split(None, 2)  # 只需前两列
+                if len(parts) >= 2:
                     try:
-                        tpb = int(parts[3])
+                        tpb = int(parts[1])
                     except ValueError:
                         pass
-            elif parts[1] == 'TimeSig':
-                if len(parts) >= 5 and '/' in parts[2]:
+            elif kind == 'TimeSig':
+                parts = rest.split(None, 3)  # 只需前三列
+                if len(parts) >= 3 and '/' in parts[0]:
                     try:
-                        numerator, denominator = map(int, parts[2].split('/'))
+                        numerator, denominator = map(int, parts[0].split('/'))
                         time_sig = (
                             numerator,
                             denominator,
-                            int(parts[3]),
-                            int(parts[4])
+                            int(parts[1]),
+                            int(parts[2])
                         )
                     except (ValueError, IndexError):
                         pass
-            elif parts[1] == 'Tempo':
-                if len(parts) >= 3:
+            elif kind == 'Tempo':
+                parts = rest.split(None, 1)  # 只需第一列
+                if parts:
                     try:
-                        tempo = int(parts[2])
+                        tempo = int(parts[0])
                     except ValueError:
                         pass
-        # ----------------------------------------------------------------
+            # ----------------------------------------------------------------
+
+            if head in _LOG_SKIP_HEADS:
+                continue  # 跳过文件头标记
+            
+            # 新增事件类型校验
+            event_type = kind.lower()
+            if event_type not in _LOG_SUPPORTED_EVENTS:
+                continue
+
+            try:
+                current_ticks = int(head)
+                delta = current_ticks - prev_ticks
+                prev_ticks = current_ticks
+                
+                # 相同类型和参数文本的行只解析一次，重复的行直接复用消息参数
+                row = (event_type, rest)
+                template = rows.get(row)
+                if template is None:
+                    template = rows[row] = _log_row_template(event_type, rest, cache) or {}
+                if template:
+                    events.append(Message(skip_checks=True, time=delta, **template))
+
+            except Exception as e:
+                line_no = log_content.count('\n', 0, m.start()) + 1
+                raise ValueError(f"第{line_no}行解析失败：{str(e)}")
 
         # 使用日志中的实际参数创建MIDI
         mid = MidiFile(ticks_per_beat=tpb)
@@ -211,88 +455,17 @@ class MidiCoreThread(threading.Thread):
             notated_32nd_notes_per_beat=time_sig[3],
             time=0))
         track.append(MetaMessage('set_tempo', tempo=tempo, time=0))
-    
-        prev_ticks = 0
-        for i, line in enumerate(log_content.split('\n')):
-            line = line.strip()
-            if not line or line.startswith('#'):  # 跳过空行和注释
-                continue
-            
-            parts = line.split()
-            if len(parts) < 2:  # 强化校验：至少包含时间戳和事件类型
-                continue
-            
-            if parts[0] in ['MFile', 'MTrk', 'TrkEnd']:
-                continue  # 跳过文件头标记
-            
-            # 新增事件类型校验
-            event_type = parts[1].lower()
-            supported_events = ['timesig', 'tempo', 'on', 'off', 'par', 'prch', 'pb']
-            if event_type not in supported_events:
-                continue
-
-            try:
-                current_ticks = int(parts[0])
-                delta = current_ticks - prev_ticks
-                prev_ticks = current_ticks
-                
-                # 统一参数解析
-                params = {}
-                for p in parts[2:]:
-                    if '=' in p:
-                        key, val = p.split('=', 1)
-                        params[key] = int(val)
-                    elif p.isdigit():  # 处理类似 Pb 8192 这样的数值
-                        params['value'] = int(p)
-
-                channel = params.get('ch', 1) - 1  # 通道号转换
-
-                # 处理不同事件类型
-                msg = None
-                if event_type == 'par' and 'c' in params:
-                    msg = Message('control_change',
-                            channel=channel,
-                            control=params['c'],
-                            value=params['v'])
-                            
-                elif event_type == 'prch' and 'p' in params:
-                    msg = Message('program_change',
-                            channel=channel,
-                            program=params['p'])
-                            
-                elif event_type == 'pb' and 'v' in params:
-                    # 转换14位Pitch Bend值（假设v是0-16383）
-                    value = min(max(params['v'], 0), 16383)
-                    msg = Message('pitchwheel',
-                            channel=channel,
-                            pitch=value - 8192)  # 转换为-8192到8191
-                            
-                elif event_type in ['on', 'note_on']:
-                    if 'n' in params:
-                        msg = Message('note_on',
-                                channel=channel,
-                                note=params['n'],
-                                velocity=params.get('v', 64))
-                elif event_type in ['off', 'note_off']:
-                    if 'n' in params:
-                        msg = Message('note_off',
-                                channel=channel,
-                                note=params['n'],
-                                velocity=params.get('v', 64))
-
-                if msg:
-                    track.append(msg.copy(time=delta))
-                
-            except Exception as e:
-                raise ValueError(f"第{i+1}行解析失败：{str(e)}")
+        track.extend(events)
             
         return mid
 
 class MidiRecorderApp:
     def __init__(self, master):
         self.master = master
-        self.core_thread = MidiCoreThread()
+        self.core_thread = MidiCoreThread(notify=self._wake_gui)
         self.core_thread.start()
+        self._recording = False
+        self._devices = None  # 设备列表缓存，点击刷新时更新
                 # 新增分辨率变量初始化
         self.resolution_var = tk.IntVar(value=480)  # 初始化分辨率变量
         self._setup_gui()
@@ -329,7 +502,7 @@ class MidiRecorderApp:
         ttk.Spinbox(save_frame, from_=20, to=300, textvariable=self.bpm_var, width=5).grid(row=1, column=3, padx=5)
         ttk.Label(save_frame, text="保存路径:").grid(row=0, column=0, padx=5, sticky=tk.W)
         # 修改默认路径显示为桌面
-        self.path_var = tk.StringVar(value=os.path.join(os.path.expanduser("~"), "Desktop"))
+        self.path_var = tk.StringVar(value=_DESKTOP)
         ttk.Entry(save_frame, textvariable=self.path_var, width=40).grid(row=0, column=1, padx=5)
         ttk.Button(save_frame, text="浏览", command=self._choose_path).grid(row=0, column=2, padx=5)
         
@@ -354,6 +527,7 @@ class MidiRecorderApp:
         
         self.log = scrolledtext.ScrolledText(log_frame)
         self.log.pack(fill=tk.BOTH, expand=True)
+        self.log.tag_config("ERROR", foreground="red")
 
         # 转换功能区
         convert_frame = ttk.LabelFrame(main_frame, text="日志转换")
@@ -364,10 +538,23 @@ class MidiRecorderApp:
                   command=self._import_log).pack(side=tk.LEFT, padx=5)
 
     def _setup_event_handling(self):
-        self.master.after(100, self._process_core_events)
+        self.master.protocol('WM_DELETE_WINDOW', self._on_close)
+        # 核心线程有新消息时注入虚拟事件，由Tk主循环处理，无需定时轮询
+        self.master.bind('<<MidiEvent>>', lambda e: self._process_core_events())
+
+    def _wake_gui(self):
+        """在核心线程中调用：向Tk事件队列投递消息通知"""
+        try:
+            self.master.event_generate('<<MidiEvent>>', when='tail')
+        except (tk.TclError, RuntimeError):
+            pass  # 窗口已关闭
 
     def _refresh_devices(self):
-        devices = MidiRecorderApp.list_devices()  # 修改为调用静态方法
+        # 复用核心线程的MidiIn/MidiOut枚举端口，结果缓存供录制时使用
+        devices = self._devices = MidiRecorderApp.list_devices(
+            self.core_thread.input, self.core_thread.output)
+        # 设备可能已插拔，同一索引未必是同一设备，下次连接时强制重新打开端口
+        self.core_thread._ports = None
         self.input_combo['values'] = [name for _, name in devices['inputs']]
         self.output_combo['values'] = [name for _, name in devices['outputs']]
         self.input_combo.current(0) if devices['inputs'] else None
@@ -379,16 +566,12 @@ class MidiRecorderApp:
             self.path_var.set(path)
 
     def _toggle_recording(self):
-        """每次录制创建新线程实例"""
-        if not self.core_thread.is_alive():
-            # 创建新线程实例
-            self.core_thread = MidiCoreThread()
-            self.core_thread.start()
-            
-            # 发送设备连接命令
+        """复用常驻的核心线程，仅发送控制命令"""
+        if not self._recording:
+            # 发送设备连接命令（端口未变化时核心线程直接跳过）
             in_idx = self.input_combo.current()
             out_idx = self.output_combo.current()
-            devices = MidiRecorderApp.list_devices()  # 修改为调用静态方法
+            devices = self._devices  # 与下拉框内容一致的缓存列表
             self.core_thread._control_queue.put((  # 修改为调用静态方法
                 'CONNECT',
                 devices['inputs'][in_idx][0],
@@ -402,40 +585,60 @@ class MidiRecorderApp:
                 self.name_var.get(),
                 self.bpm_var.get()  # 新增BPM参数
             )))
+            self._recording = True
             self.record_btn.config(text="停止录制")
         else:
-            # 发送终止命令（会自动关闭线程）
+            # 发送停止命令（保存文件，线程继续运行），等核心线程确认停止后再恢复按钮
             self.core_thread._control_queue.put(('STOP_RECORD',))
-            self.record_btn.config(text="开始录制")
+            self.record_btn.config(text="保存中...", state=tk.DISABLED)
+
+    def _on_close(self):
+        """关闭窗口时通知核心线程保存并退出"""
+        self.core_thread._notify = None  # 窗口销毁后不再唤醒GUI
+        self.core_thread._control_queue.put(('SHUTDOWN',))
+        self.master.destroy()
 
     def _process_core_events(self):
+        ring = self.core_thread._event_queue
+        self.core_thread._notify_pending = False  # 先清标记再取消息，之后的新消息会再次唤醒
+        entries = []
         while True:
-            try:
-                event_type, data = self.core_thread._event_queue.get_nowait()
-                if event_type == 'ERROR':
-                    self._log_message(data, is_error=True)
-                elif event_type == 'STATUS':
-                    self._log_message(data)
-            except queue.Empty:
+            item = ring.pop()
+            if item is None:
                 break
-        self.master.after(100, self._process_core_events)
+            event_type, data = item
+            if event_type == 'ERROR':
+                entries.append((data, True))
+            elif event_type == 'STATUS':
+                entries.append((data, False))
+            elif event_type == 'STOPPED':
+                self._recording = False
+                self.record_btn.config(text="开始录制", state=tk.NORMAL)
+        if entries:
+            self._log_messages(entries)
 
     def _log_message(self, message, is_error=False):
-        tag = "ERROR" if is_error else "INFO"
-        self.log.insert(tk.END, f"[{time.strftime('%H:%M:%S')}] {tag} - {message}\n")
-        self.log.tag_config("ERROR", foreground="red")
+        self._log_messages([(message, is_error)])
+
+    def _log_messages(self, entries):
+        """批量写入日志：整批只调用一次insert和see"""
+        stamp = time.strftime('%H:%M:%S')
+        chunks = []
+        for message, is_error in entries:
+            tag = "ERROR" if is_error else "INFO"
+            chunks += (f"[{stamp}] {tag} - {message}\n", tag)
+        self.log.insert(tk.END, *chunks)
         self.log.see(tk.END)
-        if is_error:
-            self.record_btn.config(text="开始录制")
 
     @staticmethod
-    def list_devices():
-        """静态方法获取设备列表"""
-        input = rtmidi.MidiIn()
-        output = rtmidi.MidiOut()
+    def list_devices(input=None, output=None):
+        """静态方法获取设备列表，可传入已有的MidiIn/MidiOut避免重复初始化后端"""
+        if input is None:
+            input = rtmidi.MidiIn()
+        if output is None:
+            output = rtmidi.MidiOut()
         inputs = [(i, input.get_port_name(i)) for i in range(input.get_port_count())]
         outputs = [(-1, "不使用输出")] + [(i, output.get_port_name(i)) for i in range(output.get_port_count())]
-        del input, output  # 及时释放资源
         return {'inputs': inputs, 'outputs': outputs}
 
     def _import_log(self):